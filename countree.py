@@ -3,1006 +3,1510 @@ import argparse
 import os
 import tarfile
 import sqlite3
-from ete3 import Tree, TreeStyle, NodeStyle, CircleFace, TextFace
-import matplotlib
-matplotlib.use('Agg')
-os.environ['QT_QPA_PLATFORM'] = 'offscreen'
+import itertools
+import contextlib
+import shutil
+import subprocess
+import concurrent.futures
 import json
-import traceback
+import base64
+import string
+import urllib.request
+import gzip
+import io
+import hashlib
+import pickle
+import csv
+import logging
+import logging.handlers
+import math
+import multiprocessing
+from collections import deque
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# SQLite's default bound-parameter limit before 3.32.
+SQLITE_MAX_VARIABLES = 900
+TEMP_TABLE_THRESHOLD = 500
+# Buffer size for the taxdump stream; the pipe and tarfile default to 10-16 KiB.
+TAR_BUFSIZE = 1 << 21
+# .dmp rows are "field\t|\tfield\t|\t...\t|\n"; split the raw bytes on the exact delimiter.
+DMP_DELIMITER = b'\t|\t'
+DMP_TRAILER = b'\t|\r\n'
+
+logger = logging.getLogger("countree")
+
+class TaxonNode:
+    __slots__ = ("name", "children", "taxid", "rank", "sci_name", "count", "value", "whole_count",
+                 "cumulative_count", "cumulative_value", "cumulative_whole_count")
+
+    def __init__(self, name="", taxid=0, rank="", sci_name=""):
+        self.name = name
+        self.children = []
+        self.taxid = taxid
+        self.rank = rank
+        self.sci_name = sci_name
+        self.count = 0
+        self.value = 0
+        self.whole_count = None
+        self.cumulative_count = None
+        self.cumulative_value = None
+        self.cumulative_whole_count = None
 
 class CustomNCBITaxa:
     def __init__(self, db_path):
         self.db_path = db_path
-
-    def get_connection(self):
-        return sqlite3.connect(self.db_path)
+        # The taxonomy database is never written after it is built, so open it read-only.
+        self.conn = sqlite3.connect(f"file:{urllib.request.pathname2url(db_path)}?mode=ro", uri=True,
+                                    check_same_thread=False)
+        self.conn.execute("PRAGMA cache_size=-65536")
+        self.conn.execute("PRAGMA mmap_size=268435456")
+        self.conn.execute("PRAGMA temp_store=MEMORY")
+        self.parents = {}
+        self._ranks = {}
+        self._names = {}
+        self._lineages = {}
+
+    def close(self):
+        self.conn.close()
+
+    def invalidate_calculations(self):
+        self.parents.clear()
+        self._ranks.clear()
+        self._names.clear()
+        self._lineages.clear()
+
+    def _load_query_taxids(self, cursor, taxids):
+        cursor.execute("CREATE TEMP TABLE IF NOT EXISTS query_taxids (taxid INTEGER PRIMARY KEY)")
+        cursor.execute("DELETE FROM temp.query_taxids")
+        cursor.executemany("INSERT OR IGNORE INTO temp.query_taxids VALUES (?)", ((taxid,) for taxid in taxids))
 
     def get_taxid_translator(self, taxids):
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            placeholders = ','.join('?' * len(taxids))
-            query = f"SELECT taxid, name FROM names WHERE taxid IN ({placeholders}) AND name_class = 'scientific name'"
-            cursor.execute(query, taxids)
-            return dict(cursor.fetchall())
+        cursor = self.conn.cursor()
+        # Large lookups join against a temp table instead of re-preparing many IN (...) statements.
+        if len(taxids) > TEMP_TABLE_THRESHOLD:
+            self._load_query_taxids(cursor, taxids)
+            cursor.execute("SELECT names.taxid, names.name FROM temp.query_taxids JOIN names ON names.taxid = query_taxids.taxid")
+            return dict(cursor)
+        translator = {}
+        for chunk in chunked(taxids, SQLITE_MAX_VARIABLES):
+            placeholders = ','.join('?' * len(chunk))
+            query = f"SELECT taxid, name FROM names WHERE taxid IN ({placeholders})"
+            cursor.execute(query, chunk)
+            translator.update(cursor)
+        return translator
+
+    def get_taxid_translator_batch(self, taxids):
+        misses = [taxid for taxid in set(taxids) if taxid not in self._names]
+        if misses:
+            found = self.get_taxid_translator(misses)
+            for taxid in misses:
+                self._names[taxid] = found.get(taxid)
+        return {taxid: self._names[taxid] for taxid in taxids if self._names[taxid] is not None}
+
+    def get_sci_name(self, taxid):
+        if taxid not in self._names:
+            self.get_taxid_translator_batch([taxid])
+        return self._names[taxid]
+
+    def fetch_parents(self, taxids):
+        seeds = [taxid for taxid in taxids if taxid not in self.parents]
+        if not seeds:
+            return
+        cursor = self.conn.cursor()
+        self._load_query_taxids(cursor, seeds)
+        # Resolve every ancestor of every seed in one recursive query; UNION stops at the root's self-loop.
+        cursor.execute("""
+            WITH RECURSIVE lineage(taxid) AS (
+                SELECT taxid FROM temp.query_taxids
+                UNION
+                SELECT nodes.parent FROM nodes JOIN lineage ON nodes.taxid = lineage.taxid
+            )
+            SELECT nodes.taxid, nodes.parent, nodes.rank FROM lineage JOIN nodes ON nodes.taxid = lineage.taxid
+        """)
+        for taxid, parent, rank in cursor:
+            self.parents[taxid] = parent
+            self._ranks[taxid] = sys.intern(rank)
 
     def get_lineage(self, taxid):
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            lineage = []
-            while taxid != 1:
-                cursor.execute("SELECT parent FROM nodes WHERE taxid = ?", (taxid,))
-                parent = cursor.fetchone()
-                if parent is None:
-                    break
-                lineage.append(taxid)
-                taxid = parent[0]
-            return lineage[::-1]
+        self.fetch_parents([taxid])
+        return list(self._walk_lineage(taxid))
+
+    def get_lineages_bulk(self, taxids):
+        self.fetch_parents(taxids)
+        return {taxid: list(self._walk_lineage(taxid)) for taxid in taxids}
+
+    def _walk_lineage(self, taxid):
+        # Climb until a taxid whose lineage is already known, then extend it back down.
+        pending = []
+        while taxid not in self._lineages:
+            parent = self.parents.get(taxid)
+            if taxid == 1 or parent is None:
+                self._lineages[taxid] = ()
+                break
+            pending.append(taxid)
+            taxid = parent
+        lineage = self._lineages[taxid]
+        for taxid in reversed(pending):
+            lineage = lineage + (taxid,)
+            self._lineages[taxid] = lineage
+        return lineage
 
     def get_rank(self, taxid):
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
+        if taxid not in self._ranks:
+            cursor = self.conn.cursor()
             cursor.execute("SELECT rank FROM nodes WHERE taxid = ?", (taxid,))
             result = cursor.fetchone()
-            return result[0] if result else "Unknown"
+            self._ranks[taxid] = result[0] if result else "Unknown"
+        return self._ranks[taxid]
 
     def get_topology(self, taxids):
-        common_lineage = None
-        for taxid in taxids:
-            lineage = self.get_lineage(taxid)
-            if common_lineage is None:
-                common_lineage = set(lineage)
-            else:
-                common_lineage.intersection_update(lineage)
-        
-        tree = Tree()
+        lineages = self.get_lineages_bulk(taxids)
+        common_lineage = set(lineages[taxids[0]]).intersection(*lineages.values()) if taxids else set()
+
+        self.get_taxid_translator_batch({ancestor for lineage in lineages.values() for ancestor in lineage})
+
+        # The ancestors shared by every input form a common prefix of each lineage.
+        depth = len(common_lineage) if common_lineage else 0
+        tree = TaxonNode()
+        nodes = {}
         for taxid in taxids:
-            lineage = self.get_lineage(taxid)
-            current_node = tree
-            for ancestor in lineage:
-                if ancestor not in common_lineage:
-                    child = next((child for child in current_node.children if child.name == str(ancestor)), None)
-                    if child is None:
-                        rank = self.get_rank(ancestor)
-                        current_node = current_node.add_child(name=str(ancestor))
-                        current_node.add_feature("rank", rank)
-                        current_node.add_feature("sci_name", self.get_taxid_translator([ancestor])[ancestor])
-                    else:
-                        current_node = child
+            lineage = lineages[taxid][depth:]
+            i = len(lineage)
+            while i > 0 and lineage[i - 1] not in nodes:
+                i -= 1
+            current_node = nodes[lineage[i - 1]] if i > 0 else tree
+            for ancestor in lineage[i:]:
+                child = TaxonNode(str(ancestor), ancestor, self.get_rank(ancestor), self.get_sci_name(ancestor))
+                current_node.children.append(child)
+                nodes[ancestor] = child
+                current_node = child
         return tree
 
-def process_taxdump(taxdump_path):
-    temp_dir = "temp_taxdump"
-    os.makedirs(temp_dir, exist_ok=True)
-    
-    db_path = os.path.join(temp_dir, "taxa.sqlite")
-    
-    if os.path.exists(db_path):
+def parse_nodes(f):
+    for line in itertools.chain.from_iterable(block.splitlines() for block in read_blocks(f)):
+        fields = line.rstrip(DMP_TRAILER).split(DMP_DELIMITER, 3)
+        yield int(fields[0]), int(fields[1]), fields[2].decode('ascii')
+
+def read_blocks(f, block_size=1 << 22):
+    # Large reads straight through the member's file object, cut back to the last full line.
+    tail = b''
+    while True:
+        chunk = f.read(block_size)
+        if not chunk:
+            if tail:
+                yield tail
+            return
+        cut = chunk.rfind(b'\n') + 1
+        if cut == 0:
+            tail += chunk
+            continue
+        yield tail + chunk[:cut]
+        tail = chunk[cut:]
+
+def parse_names_block(block):
+    rows = []
+    for line in block.splitlines():
+        fields = line.rstrip(DMP_TRAILER).split(DMP_DELIMITER)
+        if fields[3] == b'scientific name':
+            rows.append((int(fields[0]), fields[1].decode('utf-8')))
+    return rows
+
+def parse_names(f):
+    workers = os.cpu_count() or 1
+    # main() reads the input on another thread meanwhile, and forking a threaded process can deadlock.
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        mp_context = multiprocessing.get_context("forkserver")
+    else:
+        mp_context = None
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=mp_context) as executor:
+        pending = deque()
+        for block in read_blocks(f):
+            pending.append(executor.submit(parse_names_block, block))
+            if len(pending) >= 2 * workers:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+def chunked(items, size):
+    items = iter(items)
+    while True:
+        chunk = list(itertools.islice(items, size))
+        if not chunk:
+            return
+        yield chunk
+
+def insert_chunked(cursor, query, rows, chunk_size=10000):
+    for chunk in chunked(rows, chunk_size):
+        cursor.executemany(query, chunk)
+
+@contextlib.contextmanager
+def open_taxdump(taxdump_path):
+    pigz = shutil.which("pigz")
+    if pigz is None:
+        with open(taxdump_path, 'rb', buffering=TAR_BUFSIZE) as f:
+            with tarfile.open(fileobj=f, mode="r|gz", bufsize=TAR_BUFSIZE) as tar:
+                yield tar
+        return
+
+    with subprocess.Popen([pigz, "-dc", taxdump_path], stdout=subprocess.PIPE, bufsize=TAR_BUFSIZE) as proc:
+        try:
+            with tarfile.open(fileobj=proc.stdout, mode="r|", bufsize=TAR_BUFSIZE) as tar:
+                yield tar
+        except tarfile.ReadError:
+            if proc.wait() == 0:
+                raise
+    if proc.returncode != 0:
+        raise RuntimeError(f"pigz failed to decompress {taxdump_path} (exit code {proc.returncode})")
+
+def get_cache_dir():
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "countree")
+
+def process_taxdump(taxdump_path, force_rebuild=False):
+    cache_dir = get_cache_dir()
+    os.makedirs(cache_dir, exist_ok=True)
+
+    stat = os.stat(taxdump_path)
+    key = hashlib.blake2b(f"{stat.st_size}:{stat.st_mtime_ns}".encode(), digest_size=16).hexdigest()
+    db_path = os.path.join(cache_dir, f"{key}.sqlite")
+
+    if os.path.exists(db_path) and not force_rebuild:
         conn = sqlite3.connect(db_path)
         c = conn.cursor()
         c.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='nodes'")
         if c.fetchone():
-            c.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='names'")
-            if c.fetchone():
-                print("Using existing database.")
+            c.execute("PRAGMA table_info(names)")
+            if [row[1] for row in c.fetchall()] == ['taxid', 'name']:
+                logger.info("Using existing database.")
                 conn.close()
                 return db_path
+        conn.close()
+
+    tmp_path = f"{db_path}.{os.getpid()}.tmp"
+    try:
+        build_database(taxdump_path, tmp_path)
+        os.replace(tmp_path, db_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    shutil.rmtree(topology_cache_dir(db_path), ignore_errors=True)
+
+    logger.info("Database created or updated successfully.")
+    prune_databases(cache_dir, db_path)
+    return db_path
 
-    with tarfile.open(taxdump_path, "r:gz") as tar:
-        tar.extractall(path=temp_dir)
-    
-    nodes_path = os.path.join(temp_dir, "nodes.dmp")
-    names_path = os.path.join(temp_dir, "names.dmp")
-    
+def topology_cache_dir(db_path):
+    return os.path.splitext(db_path)[0] + ".topology"
+
+def prune_databases(cache_dir, keep_path):
+    # Each taxdump gets its own database, so drop the ones left behind by older downloads
+    # together with their topology caches.
+    keep_topology = topology_cache_dir(keep_path)
+    for entry in os.scandir(cache_dir):
+        if entry.name.endswith(".sqlite") and entry.path != keep_path:
+            try:
+                os.remove(entry.path)
+                logger.info("Removed old database %s", entry.name)
+            except OSError as e:
+                logger.warning("Could not remove old database %s: %s", entry.name, e)
+        elif entry.is_dir() and entry.path != keep_topology and (
+                entry.name.endswith(".topology") or entry.name == "topology_cache"):
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+def build_database(taxdump_path, db_path):
     conn = sqlite3.connect(db_path)
     c = conn.cursor()
-    
-    c.execute('''CREATE TABLE IF NOT EXISTS nodes
+
+    c.execute("PRAGMA journal_mode=OFF")
+    c.execute("PRAGMA synchronous=OFF")
+    c.execute("PRAGMA temp_store=MEMORY")
+
+    c.execute('''CREATE TABLE nodes
                  (taxid INTEGER PRIMARY KEY, parent INTEGER, rank TEXT)''')
-    c.execute('''CREATE TABLE IF NOT EXISTS names
-                 (taxid INTEGER, name TEXT, name_class TEXT)''')
-    
-    c.execute("DELETE FROM nodes")
-    c.execute("DELETE FROM names")
-    
+    c.execute('''CREATE TABLE names
+                 (taxid INTEGER PRIMARY KEY, name TEXT)''')
+
     conn.commit()
-    
-    with open(nodes_path, 'r') as f:
-        for line in f:
-            fields = line.strip().split('|')
-            taxid = int(fields[0])
-            parent = int(fields[1])
-            rank = fields[2].strip()
-            c.execute("INSERT INTO nodes VALUES (?, ?, ?)", (taxid, parent, rank))
-    
-    with open(names_path, 'r') as f:
-        for line in f:
-            fields = line.strip().split('|')
-            taxid = int(fields[0])
-            name = fields[1].strip()
-            name_class = fields[3].strip()
-            c.execute("INSERT INTO names VALUES (?, ?, ?)", (taxid, name, name_class))
-    
+
+    loaders = {
+        "nodes.dmp": ("INSERT INTO nodes VALUES (?, ?, ?)", parse_nodes),
+        "names.dmp": ("INSERT INTO names VALUES (?, ?)", parse_names),
+    }
+
+    c.execute("BEGIN")
+    with open_taxdump(taxdump_path) as tar:
+        for member in tar:
+            loader = loaders.get(os.path.basename(member.name))
+            if loader is None:
+                continue
+            query, parse = loader
+            with tar.extractfile(member) as f:
+                insert_chunked(c, query, parse(f))
     conn.commit()
     conn.close()
-    
-    print("Database created or updated successfully.")
-    return db_path
 
 def read_data(filename, info_type):
-    data = {}
-    with open(filename, 'r') as f:
-        for line in f:
-            parts = line.strip().split('\t')
+    with open(filename, 'r', newline='', buffering=1 << 17) as f:
+        for parts in csv.reader(f, delimiter='\t', quoting=csv.QUOTE_NONE):
             if len(parts) >= 3:
                 try:
                     taxid = int(parts[0])
                     count = float(parts[1])
                     whole_count = float(parts[2])
+                    if not (math.isfinite(count) and math.isfinite(whole_count)):
+                        raise ValueError("non-finite value")
                     if info_type == 'count':
                         value = count
-                        data[taxid] = {'value': value, 'count': count}
+                        yield taxid, {'value': value, 'count': count}
                     else:  # ratio
                         value = count / whole_count if whole_count != 0 else 0
-                        data[taxid] = {'value': value, 'count': count, 'whole_count': whole_count}
+                        yield taxid, {'value': value, 'count': count, 'whole_count': whole_count}
                 except ValueError:
-                    print(f"Warning: Skipping invalid line: {line.strip()}")
-    return data
-
-def get_threshold_indices(data_values):
-    sorted_values = sorted(data_values, reverse=True)
-    total = sum(sorted_values)
-    cumulative = 0
-    thresholds = []
-    for i, value in enumerate(sorted_values):
-        cumulative += value
-        if cumulative >= total * (1 - 1/2**len(thresholds)):
-            thresholds.append(value)
-        if len(thresholds) == 7:
-            break
-    return thresholds
-
-def accumulate_values(node, info_type):
-    if not node.children:
-        if info_type == 'count':
-            return node.count, node.value
-        else:
-            return node.count, node.whole_count, node.value
-
-    total_count = node.count
-    total_value = node.value
-    if info_type == 'ratio':
-        total_whole_count = node.whole_count
-
-    for child in node.children:
-        if info_type == 'count':
-            child_count, child_value = accumulate_values(child, info_type)
-            total_count += child_count
-            total_value += child_value
-        else:
-            child_count, child_whole_count, child_value = accumulate_values(child, info_type)
-            total_count += child_count
-            total_whole_count += child_whole_count
-
-    if info_type == 'ratio':
-        total_value = total_count / total_whole_count if total_whole_count != 0 else 0
-
-    node.add_feature("cumulative_count", total_count)
-    node.add_feature("cumulative_value", total_value)
-    if info_type == 'ratio':
-        node.add_feature("cumulative_whole_count", total_whole_count)
-        return total_count, total_whole_count, total_value
-    else:
-        return total_count, total_value
-
-def create_tree(data, ncbi, layout, info_type):
-    valid_taxids = [taxid for taxid in data.keys() if ncbi.get_taxid_translator([taxid])]
+                    line = '\t'.join(parts).strip()
+                    logger.warning("Warning: Skipping invalid line: %s", line)
+
+def traverse(tree):
+    order = []
+    stack = deque([tree])
+    while stack:
+        node = stack.pop()
+        order.append(node)
+        stack.extend(node.children)
+    return order
+
+def flatten_tree(tree):
+    # Preorder node list plus parent indices, so every parent precedes its subtree; siblings keep their order.
+    order = []
+    parents = []
+    stack = deque([(tree, -1)])
+    while stack:
+        node, parent = stack.pop()
+        parents.append(parent)
+        order.append(node)
+        index = len(order) - 1
+        stack.extend((child, index) for child in reversed(node.children))
+    return order, parents
+
+def accumulate_count(order, parents):
+    counts = [node.count for node in order]
+    values = [node.value for node in order]
+    for i in range(len(order) - 1, 0, -1):
+        parent = parents[i]
+        counts[parent] += counts[i]
+        values[parent] += values[i]
+
+    for i, node in enumerate(order):
+        if node.children:
+            node.cumulative_count = counts[i]
+            node.cumulative_value = values[i]
+    return counts[0], values[0]
+
+def accumulate_ratio(order, parents):
+    counts = [node.count for node in order]
+    whole_counts = [node.whole_count for node in order]
+    for i in range(len(order) - 1, 0, -1):
+        parent = parents[i]
+        counts[parent] += counts[i]
+        whole_counts[parent] += whole_counts[i]
+
+    for i, node in enumerate(order):
+        if node.children:
+            node.cumulative_count = counts[i]
+            node.cumulative_whole_count = whole_counts[i]
+            node.cumulative_value = counts[i] / whole_counts[i] if whole_counts[i] != 0 else 0
+    root = order[0]
+    return counts[0], whole_counts[0], root.cumulative_value if root.children else root.value
+
+def accumulate_values(tree, info_type):
+    accumulate = accumulate_ratio if info_type == 'ratio' else accumulate_count
+    return accumulate(*flatten_tree(tree))
+
+def get_cached_topology(ncbi, taxids):
+    # Pickles live next to their database and are removed when it is rebuilt or pruned.
+    cache_dir = topology_cache_dir(ncbi.db_path)
+    digest = hashlib.blake2b(repr(list(taxids)).encode(), digest_size=16).hexdigest()
+    cache_path = os.path.join(cache_dir, f"{digest}-{os.stat(ncbi.db_path).st_mtime_ns}.v3.pkl")
+
+    if os.path.exists(cache_path):
+        try:
+            with open(cache_path, 'rb') as f:
+                tree = pickle.load(f)
+            logger.info("Using cached topology.")
+            return tree
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError, ValueError) as e:
+            logger.warning("Ignoring unreadable topology cache %s: %s", cache_path, e)
+
+    tree = ncbi.get_topology(taxids)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(tree, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return tree
+
+def create_tree(data, ncbi, info_type):
+    existing = ncbi.get_taxid_translator_batch(list(data.keys()))
+    valid_taxids = [taxid for taxid in data.keys() if taxid in existing]
 
     if not valid_taxids:
         raise ValueError("No valid taxids found in the input data.")
 
-    tree = ncbi.get_topology(valid_taxids)
-
-    ts = TreeStyle()
-    ts.mode = "c" if layout == "circular" else "r"
-    ts.show_leaf_name = True
-    ts.scale = 20
-    ts.branch_vertical_margin = 10
-    ts.show_branch_support = False
+    tree = get_cached_topology(ncbi, valid_taxids)
 
-    max_count = max(d['count'] for d in data.values())
-    threshold_indices = get_threshold_indices([d['value'] for d in data.values()])
-
-    for node in tree.traverse():
-        process_node(node, data, ncbi, max_count, threshold_indices, info_type)
+    for node in traverse(tree):
+        process_node(node, data, info_type)
 
     accumulate_values(tree, info_type)
 
-    return tree, ts
+    return tree
+
+def process_node(node, data, info_type):
+    taxid = node.taxid
 
-def process_node(node, data, ncbi, max_count, threshold_indices, info_type):
-    if not node.name:
-        node.name = "Unknown"
-        taxid = 0
-    else:
-        try:
-            taxid = int(node.name)
-        except ValueError:
-            print(f"Warning: Invalid taxid '{node.name}'. Setting to 0.")
-            taxid = 0
-    
     node_data = data.get(taxid, {'count': 0, 'value': 0})
     if info_type == 'ratio':
         node_data.setdefault('whole_count', 0)
-    
+
     count = node_data['count']
     value = node_data['value']
-    
-    nstyle = NodeStyle()
-    nstyle["size"] = 0
-    
-    style_index = next((i for i, threshold in enumerate(threshold_indices) if value >= threshold), len(threshold_indices))
-    
-    width = int((style_index + 1) * 2)
-    nstyle["hz_line_width"] = max(1, width)
-    nstyle["vt_line_width"] = max(1, width)
-    
-    sci_name = ncbi.get_taxid_translator([taxid]).get(taxid, "Unknown")
-    node.name = f"{sci_name} (ID: {taxid}, Count: {count:.2f}, Value: {value:.4f})"
-    node.set_style(nstyle)
-
-    face = CircleFace(radius=max(1, width), color="skyblue", style="sphere")
-    node.add_face(face, column=0, position="branch-right")
-    
-    if hasattr(node, "rank") and hasattr(node, "sci_name"):
-        info_text = f"{node.rank}: {node.sci_name}"
-        info_face = TextFace(info_text, fsize=8, fgcolor="gray")
-        node.add_face(info_face, column=0, position="branch-top")
-
-    node.add_feature("count", count)
-    node.add_feature("value", value)
+
+    sci_name = node.sci_name or "Unknown"
+    node.name = "%s (ID: %d, Count: %.2f, Value: %.4f)" % (sci_name, taxid, count, value)
+    node.count = count
+    node.value = value
     if info_type == 'ratio':
-        node.add_feature("whole_count", node_data['whole_count'])
+        node.whole_count = node_data['whole_count']
+
+class HTMLTemplate(string.Template):
+    # '$' and braces are everywhere in the embedded JS, so placeholders use '@' instead.
+    delimiter = '@'
+
+HTML_HEAD = """<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>Phylogenetic Tree</title>
+    <script src="https://d3js.org/d3.v6.min.js"></script>
+    <style>
+        body { font-family: Arial, sans-serif; margin: 0; padding: 0; }
+        #tree-container { width: 100vw; height: 100vh; }
+        .node circle { fill: #fff; stroke: steelblue; stroke-width: 1.5px; }
+        .node text { font-weight: bold; }
+        /* Labels carry their unzoomed size; zooming only updates --zoom-sqrt on the tree group. */
+        #tree-container text { font-size: calc(var(--base-font) / var(--zoom-sqrt, 1)); }
+        .link { fill: none; stroke: #ccc; stroke-width: 1.5px; }
+        .tooltip {
+            position: fixed;
+            background-color: white;
+            padding: 10px;
+            border: 1px solid black;
+            border-radius: 5px;
+            opacity: 0;
+            transition: opacity 200ms;
+            pointer-events: auto;
+            user-select: text;
+            z-index: 1000;
+        }
+        .context-menu {
+            position: fixed;
+            background-color: #f9f9f9;
+            padding: 5px;
+            border: 1px solid #ddd;
+            border-radius: 5px;
+            opacity: 0;
+            transition: opacity 200ms;
+            pointer-events: auto;
+            z-index: 1001;
+        }
+        .context-menu button {
+            display: block;
+            width: 100%;
+            padding: 5px;
+            margin: 2px 0;
+            text-align: left;
+            border: none;
+            background: none;
+            cursor: pointer;
+        }
+        .context-menu button:hover {
+            background-color: #f1f1f1;
+        }
+        .button-container {
+            position: fixed;
+            top: 10px;
+            left: 10px;
+            display: flex;
+            flex-direction: column;
+            gap: 10px;
+        }
+        .button-container button {
+            width: 150px;
+        }
+        #custom-alert {
+            position: fixed;
+            color: white;
+            padding: 10px;
+            border-radius: 5px;
+            display: none;
+            z-index: 1000;
+            pointer-events: none;
+        }
+        #custom-alert.blue {
+            background-color: rgba(0, 0, 255, 0.5);
+        }
+        #custom-alert.yellow {
+            background-color: rgba(255, 255, 0, 0.7);
+            color: black;
+        }
+        #stored-data-display {
+            position: fixed;
+            top: 50%;
+            left: 50%;
+            transform: translate(-50%, -50%);
+            background-color: white;
+            padding: 20px;
+            border: 1px solid black;
+            z-index: 1000;
+            max-width: 80%;
+            max-height: 80%;
+            overflow: auto;
+            white-space: pre-wrap;
+            user-select: text;
+            display: none;
+        }
+        #legend-container {
+            position: fixed;
+            top: 20px;
+            right: 280px;
+            width: 200px;
+            font-size: 12px;
+            background-color: rgba(255, 255, 255, 0.8);
+            padding: 10px;
+            border-radius: 5px;
+            box-shadow: 0 0 10px rgba(0,0,0,0.1);
+        }
+        #legend-svg {
+            width: 100%;
+            height: 40px;
+        }
+        #node-info-settings {
+            position: fixed;
+            top: 20px;
+            right: 20px;
+            background-color: white;
+            padding: 10px;
+            border: 1px solid black;
+            z-index: 1000;
+        }
+        .node-info-header {
+            display: flex;
+            justify-content: space-between;
+            align-items: center;
+            margin-bottom: 10px;
+        }
+        .toggle-button {
+            background: none;
+            border: none;
+            font-size: 20px;
+            cursor: pointer;
+        }
+        .node-info-item {
+            margin-bottom: 5px;
+        }
+        #node-layout-input {
+            width: 100%;
+            margin-top: 10px;
+        }
+        #font-size-slider {
+            width: 100%;
+            margin-top: 10px;
+        }
+        #max-font-size-display {
+            margin-top: 5px;
+        }
+    </style>
+</head>
+<body>
+    <div id="tree-container"></div>
+    <div id="tooltip" class="tooltip" style="opacity: 0;"></div>
+    <div id="context-menu" class="context-menu" style="display: none;">
+        <button id="add-button">Add</button>
+        <button id="remove-button">Remove</button>
+    </div>
+    <div class="button-container">
+        <button id="view-stored-button">View Stored Data</button>
+        <button id="remove-stored-button">Remove Stored Data</button>
+        <button id="store-data-button">Store The Data</button>
+        <button id="load-tsv-button">Load TSV File</button>
+    </div>
+    <div id="legend-container"></div>
+    <div id="custom-alert"></div>
+    <div id="stored-data-display"></div>
+    <div id="node-info-settings">
+        <div class="node-info-header">
+            <h3 style="margin: 0;">Node Display Settings</h3>
+            <button id="toggle-widget" class="toggle-button">−</button>
+        </div>
+        <div id="widget-content">
+            <div id="node-info-checkboxes"></div>
+            <input type="text" id="node-layout-input" placeholder="Enter node layout">
+            <button id="update-display-button">Update Display</button>
+            <div>
+                <label for="font-size-slider">Max Font Size:</label>
+                <input type="range" id="font-size-slider" min="10" max="80" value="20">
+                <span id="max-font-size-display">20</span>
+            </div>
+        </div>
+    </div>
+    <script type="module">
+    const treePayload = \""""
+
+HTML_TAIL = HTMLTemplate("""";
+
+    // The tree columns are embedded as base64 gzip and inflated with the browser's native decompressor.
+    async function decodeTreeColumns(payload) {
+        const binary = atob(payload);
+        const bytes = new Uint8Array(binary.length);
+        for (let i = 0; i < binary.length; i++) bytes[i] = binary.charCodeAt(i);
+        const stream = new Blob([bytes]).stream().pipeThrough(new DecompressionStream('gzip'));
+        return new Response(stream).json();
+    }
+
+    function buildTree(columns) {
+        const keys = Object.keys(columns).filter(key => key !== "parent");
+        const parents = columns.parent;
+        const nodes = new Array(parents.length);
+        for (let i = 0; i < parents.length; i++) {
+            const data = {children: []};
+            for (const key of keys) {
+                const value = columns[key][i];
+                if (value !== null) data[key] = value;
+            }
+            nodes[i] = data;
+            if (parents[i] >= 0) nodes[parents[i]].children.push(data);
+        }
+        return nodes[0];
+    }
+
+    const treeData = buildTree(await decodeTreeColumns(treePayload));
+    const layout = "@layout";
+    const info_type = "@info_type";
+    const font = "@font";
+    const level = "@level";
+
+    const width = window.innerWidth;
+    const height = window.innerHeight;
+    const margin = {top: 50, right: 50, bottom: 50, left: 50};
+
+    let tree, root;
+
+    if (layout === "circular") {
+        const radius = Math.min(width, height) / 2 - Math.max(margin.top, margin.right, margin.bottom, margin.left);
+        tree = d3.cluster().size([2 * Math.PI, radius]);
+        root = tree(d3.hierarchy(treeData).sort((a, b) => d3.ascending(a.data.name, b.data.name)));
+    } else {
+        const nodeCount = d3.hierarchy(treeData).descendants().length;
+        const treeHeight = Math.max(height - margin.top - margin.bottom, nodeCount * 15);
+        tree = d3.tree().size([treeHeight, width - margin.left - margin.right]);
+        root = tree(d3.hierarchy(treeData));
+    }
+
+    const viewBox = layout === "circular" ? [-width / 2, -height / 2, width, height] : [0, 0, width, height];
+
+    const svg = d3.select("#tree-container").append("svg")
+        .attr("width", "100%")
+        .attr("height", "100%")
+        .attr("viewBox", viewBox)
+        .style("font", "10px sans-serif")
+        .style("user-select", "none");
+
+    const g = svg.append("g");
+
+    if (layout === "linear") {
+        g.attr("transform", `translate(${margin.left},${margin.top})`);
+    }
+
+    const cumulative_values = root.descendants().map(d => d.data.cumulative_value);
+    const minValue = d3.min(cumulative_values);
+    const maxValue = d3.max(cumulative_values);
+
+    let colorScale, fontSizeScale;
+
+    function updateScales(maxFontSize) {
+        const minFontSize = 5;  // 최소 폰트 크기
+        const fontSizes = [];
+        const step = (maxFontSize - minFontSize) / 8;
+
+        for (let i = 1; i < 8; i++) {  // 가장 작은 값을 무시하고 7개의 값만 사용
+            fontSizes.push(minFontSize + step * i);
+        }
+
+        if (level === "continuous") {
+            if (font === "absolutely") {
+                colorScale = d3.scaleSequential(d3.interpolateRainbow)
+                    .domain([1, 0]);
+
+                fontSizeScale = d3.scaleQuantile()
+                    .domain([0.00001, 1])
+                    .range(fontSizes);
+            } else { // relatively
+                colorScale = d3.scaleSequential(d3.interpolateRainbow)
+                    .domain([maxValue, minValue]);
+
+                fontSizeScale = d3.scaleQuantile()
+                    .domain([minValue, maxValue])
+                    .range(fontSizes);
+            }
+        } else { // discontinuous
+            const colors = ["#8F00FF", "#4B0082", "#0000FF", "#00FF00", "#FFFF00", "#FF7F00", "#FF0000"];
+            if (font === "absolutely") {
+                const thresholds = [0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1]; //Arabidopsis의 chloroplast/all protein 비율이 0.0125정도임
+                colorScale = d3.scaleThreshold()
+                    .domain(thresholds)
+                    .range(colors);
+
+                fontSizeScale = d3.scaleThreshold()
+                    .domain(thresholds)
+                    .range(fontSizes);
+            } else { // relatively
+                const step = (maxValue - minValue) / (colors.length - 1);
+                const thresholds = d3.range(colors.length - 1).map(i => minValue + step * (i + 1));
+
+                colorScale = d3.scaleThreshold()
+                    .domain(thresholds)
+                    .range(colors);
+
+                fontSizeScale = d3.scaleQuantile()
+                    .domain([minValue, maxValue])
+                    .range(fontSizes);
+            }
+        }
+    }
+
+    // Initialize scales with default max font size
+    updateScales(20);
+
+    function getColor(cumulative_value) {
+        return colorScale(cumulative_value);
+    }
+
+    function getFontSize(cumulative_value) {
+        return fontSizeScale(Math.max(0.00001, cumulative_value));
+    }
+
+    // Unzoomed label size per node; it only changes with the max font size, not with zoom.
+    function updateBaseFontSizes() {
+        root.each(d => { d.baseFont = getFontSize(d.data.cumulative_value); });
+    }
+
+    updateBaseFontSizes();
+
+    const link = g.append("g")
+        .attr("fill", "none")
+        .attr("stroke", "#555")
+        .attr("stroke-opacity", 0.4)
+        .attr("stroke-width", 1.5)
+        .selectAll("path")
+        .data(root.links())
+        .join("path")
+        .attr("d", layout === "circular" 
+            ? d3.linkRadial().angle(d => d.x).radius(d => d.y)
+            : d3.linkHorizontal().x(d => d.y).y(d => d.x));
+
+
+    const toggleButton = document.getElementById('toggle-widget');
+    const widgetContent = document.getElementById('widget-content');
+    let isWidgetOpen = true;
+
+    toggleButton.addEventListener('click', () => {
+        isWidgetOpen = !isWidgetOpen;
+        widgetContent.style.display = isWidgetOpen ? 'block' : 'none';
+        toggleButton.textContent = isWidgetOpen ? '−' : '+';
+    });
+
+    let nodeInfoDisplay = {
+        'sci_name': true,
+        'rank': true,
+        'taxid': false,
+        'count': false,
+        'value': false,
+        'cumulative_count': false,
+        'cumulative_value': false
+    };
+
+    let nodeLayout = "$(sci_name) ($(rank))";
+
+    function createNodeInfoSettings() {
+        const container = document.getElementById('node-info-checkboxes');
+        for (const [key, value] of Object.entries(nodeInfoDisplay)) {
+            const div = document.createElement('div');
+            div.className = 'node-info-item';
+            const checkbox = document.createElement('input');
+            checkbox.type = 'checkbox';
+            checkbox.id = key;
+            checkbox.checked = value;
+            checkbox.onchange = updateCheckboxState;
+            const label = document.createElement('label');
+            label.htmlFor = key;
+            label.textContent = key;
+            div.appendChild(checkbox);
+            div.appendChild(label);
+            container.appendChild(div);
+        }
+        document.getElementById('node-layout-input').value = nodeLayout;
+    }
+
+    function updateCheckboxState(event) {
+        const key = event.target.id;
+        nodeInfoDisplay[key] = event.target.checked;
+        updateNodeLayout();
+    }
+
+    function updateNodeLayout() {
+        let newLayout = "";
+        for (const [key, value] of Object.entries(nodeInfoDisplay)) {
+            if (value) {
+                newLayout += `$(${key}) `;
+            }
+        }
+        nodeLayout = newLayout.trim();
+        document.getElementById('node-layout-input').value = nodeLayout;
+        updateNodeDisplay();
+    }
+
+    function updateNodeDisplay() {
+        nodeLayout = document.getElementById('node-layout-input').value;
+        updateNodeText();
+    }
+
+    function updateNodeText() {
+        updateNodeLabels();
+        nodeTexts
+            .text(d => d.label)
+            .attr("fill", d => getColor(d.data.cumulative_value))
+            .style("--base-font", d => `${d.baseFont}px`);
+        cullNodes(latestTransform);
+    }
+
+    // Rough glyph width in ems, used to estimate how far a label reaches from its node.
+    const LABEL_CHAR_WIDTH = 0.7;
+
+    // Label text plus its unzoomed length in pixels; the culling margin grows with the latter.
+    function updateNodeLabels() {
+        root.each(d => {
+            d.label = getNodeLabel(d.data);
+            d.labelExtent = d.baseFont * LABEL_CHAR_WIDTH * d.label.length;
+        });
+    }
+
+    function getNodeLabel(data) {
+        let label = nodeLayout;
+        const placeholders = {
+            '$(sci_name)': data.sci_name,
+            '$(rank)': data.rank,
+            '$(taxid)': data.taxid,
+            '$(count)': data.count,
+            '$(value)': data.value.toFixed(4),
+            '$(cumulative_count)': data.cumulative_count,
+            '$(cumulative_value)': data.cumulative_value.toFixed(4)
+        };
+
+        for (const [placeholder, value] of Object.entries(placeholders)) {
+            label = label.replace(placeholder, value);
+        }
+
+        return label.trim();
+    }
+
+    createNodeInfoSettings();
+    updateNodeLabels();
+
+    // Pick the per-layout accessors once instead of testing the layout for every node.
+    const nodeTransform = layout === "circular"
+        ? d => `rotate(${d.x * 180 / Math.PI - 90}) translate(${d.y},0)`
+        : d => `translate(${d.y},${d.x})`;
+    const labelX = layout === "circular"
+        ? d => (d.x < Math.PI === !d.children ? 6 : -6)
+        : d => (d.children ? -6 : 6);
+    const labelAnchor = layout === "circular"
+        ? d => (d.x < Math.PI === !d.children ? "start" : "end")
+        : d => (d.children ? "end" : "start");
+    const labelTransform = layout === "circular"
+        ? d => (d.x >= Math.PI ? "rotate(180)" : null)
+        : null;
+
+    // Node anchor points in tree coordinates, used to cull nodes that are zoomed or panned out of view.
+    root.each(d => {
+        if (layout === "circular") {
+            d.px = d.y * Math.cos(d.x - Math.PI / 2);
+            d.py = d.y * Math.sin(d.x - Math.PI / 2);
+        } else {
+            d.px = d.y;
+            d.py = d.x;
+        }
+        d.visible = true;
+    });
+
+    const node = g.append("g")
+        .attr("stroke-linejoin", "round")
+        .attr("stroke-width", 3)
+        .selectAll("g")
+        .data(root.descendants())
+        .join("g")
+        .attr("transform", nodeTransform);
+
+    node.append("circle")
+        .attr("fill", d => d.children ? "#555" : "#999")
+        .attr("r", 2.5);
+
+    node.append("text")
+        .attr("dy", "0.31em")
+        .attr("x", labelX)
+        .attr("text-anchor", labelAnchor)
+        .attr("transform", labelTransform)
+        .text(d => d.label)
+        .attr("fill", d => getColor(d.data.cumulative_value))
+        .style("--base-font", d => `${d.baseFont}px`)
+        .clone(true).lower()
+        .attr("stroke", "white");
+
+    // Labels and their white halo clones never change after this point, so select them once.
+    const nodeTexts = node.selectAll("text");
+
+    const tooltip = d3.select("#tooltip");
+    const contextMenu = d3.select("#context-menu");
+
+    let activeNode = null;
+    let hideTimer = null;
+    let isMouseOverNode = false;
+    let isMouseOverTooltipOrMenu = false;
+
+    function showTooltipAndMenu(event, d) {
+        if (activeNode !== d) {
+            clearTimeout(hideTimer);
+            hideTooltipAndMenu(() => {
+                displayNodeInfo(event, d);
+            });
+        }
+        isMouseOverNode = true;
+    }
+
+    function displayNodeInfo(event, d) {
+        const [x, y] = d3.pointer(event, svg.node());
+        const adjustedX = x + (layout === "circular" ? width / 2 : 0);
+        const adjustedY = y + (layout === "circular" ? height / 2 : 0);
+
+        tooltip.style("opacity", 0)
+            .style("left", adjustedX + "px")
+            .style("top", adjustedY + "px")
+            .html(`<div>
+                    <strong>${d.data.sci_name}</strong><br/>
+                    Rank: ${d.data.rank}<br/>
+                    Taxid: ${d.data.taxid}<br/>
+                    Count: ${d.data.count}<br/>
+                    Value: ${d.data.value.toFixed(4)}<br/>
+                    Cumulative Count: ${d.data.cumulative_count}<br/>
+                    Cumulative Value: ${d.data.cumulative_value.toFixed(4)}
+                    ${info_type === 'ratio' ? `<br/>Whole Count: ${d.data.whole_count}<br/>Cumulative Whole Count: ${d.data.cumulative_whole_count}` : ''}
+                   </div>`);
+
+        tooltip.transition().duration(200).style("opacity", 0.9);
+
+        const tooltipRect = tooltip.node().getBoundingClientRect();
+
+        contextMenu.style("opacity", 0)
+            .style("display", "block")
+            .style("left", (tooltipRect.right + 5) + "px")
+            .style("top", tooltipRect.top + "px");
+
+        contextMenu.transition().duration(200).style("opacity", 1);
+
+        d3.select("#add-button").on("click", () => addToTSV(d));
+        d3.select("#remove-button").on("click", () => removeFromTSV(d));
+
+        activeNode = d;
+    }
+
+    function startHideTimer() {
+        isMouseOverNode = false;
+        if (!isMouseOverTooltipOrMenu) {
+            clearTimeout(hideTimer);
+            hideTimer = setTimeout(() => hideTooltipAndMenu(), 500);
+        }
+    }
+
+    // Show queued behind the running fade. It lives outside the transition so a later hide, such as
+    // the one every zoom frame makes, restarts the fade without dropping it.
+    let pendingShow = null;
+
+    function hideTooltipAndMenu(callback) {
+        if (!activeNode || (!isMouseOverNode && !isMouseOverTooltipOrMenu)) {
+            if (callback) pendingShow = callback;
+            tooltip.transition().duration(200).style("opacity", 0);
+            // Finish off in the frame the fade ends; a newer transition interrupts this one and takes over.
+            contextMenu.transition().duration(200).style("opacity", 0)
+                .on("end", () => {
+                    contextMenu.style("display", "none");
+                    activeNode = null;
+                    const show = pendingShow;
+                    pendingShow = null;
+                    if (show) show();
+                });
+        }
+    }
+
+    node.on("mouseover", showTooltipAndMenu)
+        .on("mouseout", startHideTimer);
+
+    function enterTooltipOrMenu() {
+        clearTimeout(hideTimer);
+        isMouseOverTooltipOrMenu = true;
+    }
+
+    function leaveTooltipOrMenu() {
+        isMouseOverTooltipOrMenu = false;
+        if (!isMouseOverNode) {
+            startHideTimer();
+        }
+    }
+
+    d3.selectAll([tooltip.node(), contextMenu.node()])
+        .on("mouseover", enterTooltipOrMenu)
+        .on("mouseout", leaveTooltipOrMenu);
+
+    const customAlert = document.getElementById('custom-alert');
+    let customAlertTimer = null;
+
+    function showCustomAlert(message, x, y, isWarning = false) {
+        // Apply position and visibility in one style write so the alert costs a single layout.
+        customAlert.textContent = message;
+        customAlert.className = isWarning ? 'yellow' : 'blue';
+        customAlert.style.cssText = `left: ${x + 10}px; top: ${y - 50}px; display: block;`;
+        clearTimeout(customAlertTimer);
+        customAlertTimer = setTimeout(() => {
+            customAlert.style.display = 'none';
+        }, 2000);
+    }
+
+    // Stored selections are kept in memory, keyed by taxid in insertion order, and written back to
+    // localStorage shortly after the last change. Other Countree pages share the same key, so only this
+    // page's own adds and removes (taxid -> item, or null for a removal) are merged into the stored value.
+    function readStoredData() {
+        return new Map(JSON.parse(localStorage.getItem('storedData') || '[]').map(item => [item.taxid, item]));
+    }
+
+    function applyPendingChanges(map) {
+        for (const [taxid, item] of pendingChanges) {
+            if (item) {
+                map.set(taxid, item);
+            } else {
+                map.delete(taxid);
+            }
+        }
+        return map;
+    }
+
+    let storedMap = readStoredData();
+    const pendingChanges = new Map();
+    let storedWriteTimer = null;
+
+    function writeStoredData() {
+        clearTimeout(storedWriteTimer);
+        storedWriteTimer = null;
+        storedMap = applyPendingChanges(readStoredData());
+        pendingChanges.clear();
+        localStorage.setItem('storedData', JSON.stringify([...storedMap.values()]));
+    }
+
+    // Load and remove-all replace the stored data outright, dropping any unwritten changes.
+    function replaceStoredData(map) {
+        clearTimeout(storedWriteTimer);
+        storedWriteTimer = null;
+        pendingChanges.clear();
+        storedMap = map;
+        if (map.size) {
+            localStorage.setItem('storedData', JSON.stringify([...map.values()]));
+        } else {
+            localStorage.removeItem('storedData');
+        }
+    }
+
+    window.addEventListener('storage', (event) => {
+        if (event.key === 'storedData' || event.key === null) {
+            storedMap = applyPendingChanges(readStoredData());
+        }
+    });
+
+    function scheduleStoredDataWrite() {
+        clearTimeout(storedWriteTimer);
+        storedWriteTimer = setTimeout(writeStoredData, 300);
+    }
+
+    window.addEventListener('pagehide', () => {
+        if (storedWriteTimer !== null) writeStoredData();
+    });
+
+    function addToTSV(d) {
+        const taxid = String(d.data.taxid);
+        if (!storedMap.has(taxid)) {
+            const item = {
+                rank: d.data.rank,
+                sci_name: d.data.sci_name,
+                taxid: taxid,
+                count: d.data.count,
+                ratio: d.data.ratio,
+                cumulative_count: d.data.cumulative_count,
+                cumulative_value: d.data.cumulative_value
+            };
+            storedMap.set(taxid, item);
+            pendingChanges.set(taxid, item);
+            scheduleStoredDataWrite();
+            showCustomAlert(`Added sci_name ${d.data.sci_name} (Taxid: ${taxid})`, event.pageX, event.pageY);
+        } else {
+            showCustomAlert(`Taxid ${taxid} already exists in stored data`, event.pageX, event.pageY, true);
+        }
+    }
+
+    function removeFromTSV(d) {
+        const taxid = String(d.data.taxid);
+        storedMap.delete(taxid);
+        pendingChanges.set(taxid, null);
+        scheduleStoredDataWrite();
+        showCustomAlert(`Removed sci_name ${d.data.sci_name} (Taxid: ${taxid})`, event.pageX, event.pageY);
+    }
+
+    const storedDataDisplay = document.getElementById('stored-data-display');
+    const storedDataCloseButton = document.createElement('button');
+    storedDataCloseButton.textContent = 'Close';
+    storedDataCloseButton.style.marginTop = '10px';
+    storedDataCloseButton.onclick = () => storedDataDisplay.style.display = 'none';
+
+    function viewStoredData() {
+        // Swap in the new text and the button in a single DOM mutation.
+        const storedText = document.createTextNode(JSON.stringify([...storedMap.values()], null, 2));
+        storedDataDisplay.replaceChildren(storedText, storedDataCloseButton);
+        storedDataDisplay.style.display = 'block';
+    }
+
+    function storeTheData() {
+        if (storedMap.size === 0) {
+            alert('No data to store. Please add some data first.');
+            return;
+        }
+
+        // Hand the rows to the Blob as separate parts rather than joining one large string first.
+        const parts = [];
+        for (const item of storedMap.values()) {
+            const separator = parts.length ? '\\n' : '';
+            parts.push(`${separator}${item.rank}\t${item.sci_name}\t${item.taxid}\t${item.count}\t${item.ratio}\t${item.cumulative_count}\t${item.cumulative_value}`);
+        }
+
+        const blob = new Blob(parts, { type: 'text/tab-separated-values' });
+        const url = URL.createObjectURL(blob);
+        const link = document.createElement('a');
+        link.href = url;
+        const outputFileName = '@output_name';
+        link.download = `${outputFileName}.select`;
+        link.click();
+        URL.revokeObjectURL(url);
+        alert('Data has been stored in the TSV file.');
+    }
+
+    function parseSelectLine(line) {
+        const [rank, sci_name, taxid, count, ratio, cumulative_count, cumulative_value] = line.split('\\t');
+        return { 
+            rank, 
+            sci_name, 
+            taxid, 
+            count: parseFloat(count), 
+            ratio: parseFloat(ratio),
+            cumulative_count: parseFloat(cumulative_count),
+            cumulative_value: parseFloat(cumulative_value)
+        };
+    }
+
+    async function readSelectFile(file) {
+        // Decode and split the file as it streams in instead of holding the whole text and its line array.
+        const reader = file.stream().pipeThrough(new TextDecoderStream()).getReader();
+        const data = [];
+        let buffer = '';
+        for (;;) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            buffer += value;
+            let start = 0;
+            let end;
+            while ((end = buffer.indexOf('\\n', start)) >= 0) {
+                data.push(parseSelectLine(buffer.slice(start, end)));
+                start = end + 1;
+            }
+            buffer = buffer.slice(start);
+        }
+        if (buffer) data.push(parseSelectLine(buffer));
+        return data;
+    }
+
+    function loadTSVFile() {
+        if (confirm('Are you sure you want to load the TSV file? This will overwrite the current stored data.')) {
+            const input = document.createElement('input');
+            input.type = 'file';
+            input.accept = '.select';
+            input.onchange = async function(event) {
+                const data = await readSelectFile(event.target.files[0]);
+                replaceStoredData(new Map(data.map(item => [item.taxid, item])));
+                alert('TSV file loaded successfully.');
+            };
+            input.click();
+        }
+    }
+
+    function removeStoredData() {
+        if (confirm('Are you sure you want to remove all stored data?')) {
+            replaceStoredData(new Map());
+            alert('All stored data has been removed.');
+        }
+    }
+
+    // Zoom events can fire several times per frame; keep the latest transform and repaint once per frame.
+    let latestTransform = d3.zoomIdentity;
+    let zoomFramePending = false;
+
+    // Zoom scale currently applied to the labels through --zoom-sqrt.
+    let labelScale = 1;
+
+    // SVG units kept around the visible area on top of each node's label reach, for halos and glyph overhang.
+    const CULL_MARGIN = 20;
+
+    function cullNodes(transform) {
+        // The SVG fills the window and letterboxes the viewBox, so after a resize the visible area can
+        // extend past it; map the SVG's on-screen corners back into tree coordinates instead.
+        const svgNode = svg.node();
+        const rect = svgNode.getBoundingClientRect();
+        const toSvg = svgNode.getScreenCTM().inverse();
+        const topLeft = new DOMPoint(rect.left, rect.top).matrixTransform(toSvg);
+        const bottomRight = new DOMPoint(rect.right, rect.bottom).matrixTransform(toSvg);
+        const k = transform.k;
+        const sqrtK = Math.sqrt(k);
+        const x0 = transform.invertX(topLeft.x);
+        const x1 = transform.invertX(bottomRight.x);
+        const y0 = transform.invertY(topLeft.y);
+        const y1 = transform.invertY(bottomRight.y);
+        node.each(function(d) {
+            // Labels are drawn at baseFont * sqrt(k) and may point in any direction, so pad the visible
+            // area by the label's zoomed length (plus its 6px offset) converted back to tree units.
+            const pad = (CULL_MARGIN + d.labelExtent * sqrtK) / k + 6;
+            const visible = d.px >= x0 - pad && d.px <= x1 + pad && d.py >= y0 - pad && d.py <= y1 + pad;
+            if (visible !== d.visible) {
+                d.visible = visible;
+                this.style.display = visible ? "" : "none";
+            }
+        });
+    }
+
+    function renderZoom() {
+        zoomFramePending = false;
+        g.attr("transform", latestTransform);
+        hideTooltipAndMenu();
+        cullNodes(latestTransform);
+
+        // One custom property drives every label's size; panning keeps the scale and skips it.
+        if (latestTransform.k !== labelScale) {
+            labelScale = latestTransform.k;
+            g.style("--zoom-sqrt", Math.sqrt(labelScale));
+        }
+    }
+
+    const zoom = d3.zoom()
+        .scaleExtent([0.1, 10])
+        .on("zoom", (event) => {
+            latestTransform = event.transform;
+            if (!zoomFramePending) {
+                zoomFramePending = true;
+                requestAnimationFrame(renderZoom);
+            }
+        });
+
+    svg.call(zoom);
+
+    let resizeFramePending = false;
+
+    // Resizing changes how much of the tree the SVG shows, so re-cull once the new size is laid out.
+    window.addEventListener('resize', () => {
+        if (resizeFramePending) return;
+        resizeFramePending = true;
+        requestAnimationFrame(() => {
+            resizeFramePending = false;
+            cullNodes(latestTransform);
+        });
+    });
+
+    // Font size slider
+    const fontSizeSlider = document.getElementById('font-size-slider');
+    const maxFontSizeDisplay = document.getElementById('max-font-size-display');
+
+    let sliderFramePending = false;
+
+    // Dragging fires input for every step; update the readout at once but relabel at most once per frame.
+    fontSizeSlider.addEventListener('input', function() {
+        maxFontSizeDisplay.textContent = parseInt(this.value);
+        if (sliderFramePending) return;
+        sliderFramePending = true;
+        requestAnimationFrame(() => {
+            sliderFramePending = false;
+            updateScales(parseInt(fontSizeSlider.value));
+            updateBaseFontSizes();
+            updateNodeText();
+        });
+    }, { passive: true });
+
+    // Module scripts keep their functions out of the global scope, so wire the buttons up here.
+    document.getElementById('view-stored-button').addEventListener('click', viewStoredData);
+    document.getElementById('remove-stored-button').addEventListener('click', removeStoredData);
+    document.getElementById('store-data-button').addEventListener('click', storeTheData);
+    document.getElementById('load-tsv-button').addEventListener('click', loadTSVFile);
+    document.getElementById('update-display-button').addEventListener('click', updateNodeDisplay);
+
+    </script>
+</body>
+</html>
+""")
 
 def create_html_output(tree, output_file, layout, info_type, font, level):
     try:
-        print("Starting HTML output creation...")
-        tree_data = tree_to_dict(tree)
-        print(f"Tree data created. Root node: {tree_data['name']}")
+        logger.info("Starting HTML output creation...")
+        tree_data = tree_to_columns(tree)
+        logger.info("Tree data created. Root node: %s", tree_data['name'][0])
         
-        html_content = f"""
-        <!DOCTYPE html>
-        <html lang="en">
-        <head>
-            <meta charset="UTF-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-            <title>Phylogenetic Tree</title>
-            <script src="https://d3js.org/d3.v6.min.js"></script>
-            <style>
-                body {{ font-family: Arial, sans-serif; margin: 0; padding: 0; }}
-                #tree-container {{ width: 100vw; height: 100vh; }}
-                .node circle {{ fill: #fff; stroke: steelblue; stroke-width: 1.5px; }}
-                .node text {{ font-weight: bold; }}
-                .link {{ fill: none; stroke: #ccc; stroke-width: 1.5px; }}
-                .tooltip {{
-                    position: fixed;
-                    background-color: white;
-                    padding: 10px;
-                    border: 1px solid black;
-                    border-radius: 5px;
-                    opacity: 0;
-                    transition: opacity 200ms;
-                    pointer-events: auto;
-                    user-select: text;
-                    z-index: 1000;
-                }}
-                .context-menu {{
-                    position: fixed;
-                    background-color: #f9f9f9;
-                    padding: 5px;
-                    border: 1px solid #ddd;
-                    border-radius: 5px;
-                    opacity: 0;
-                    transition: opacity 200ms;
-                    pointer-events: auto;
-                    z-index: 1001;
-                }}
-                .context-menu button {{
-                    display: block;
-                    width: 100%;
-                    padding: 5px;
-                    margin: 2px 0;
-                    text-align: left;
-                    border: none;
-                    background: none;
-                    cursor: pointer;
-                }}
-                .context-menu button:hover {{
-                    background-color: #f1f1f1;
-                }}
-                .button-container {{
-                    position: fixed;
-                    top: 10px;
-                    left: 10px;
-                    display: flex;
-                    flex-direction: column;
-                    gap: 10px;
-                }}
-                .button-container button {{
-                    width: 150px;
-                }}
-                #custom-alert {{
-                    position: fixed;
-                    color: white;
-                    padding: 10px;
-                    border-radius: 5px;
-                    display: none;
-                    z-index: 1000;
-                    pointer-events: none;
-                }}
-                #custom-alert.blue {{
-                    background-color: rgba(0, 0, 255, 0.5);
-                }}
-                #custom-alert.yellow {{
-                    background-color: rgba(255, 255, 0, 0.7);
-                    color: black;
-                }}
-                #stored-data-display {{
-                    position: fixed;
-                    top: 50%;
-                    left: 50%;
-                    transform: translate(-50%, -50%);
-                    background-color: white;
-                    padding: 20px;
-                    border: 1px solid black;
-                    z-index: 1000;
-                    max-width: 80%;
-                    max-height: 80%;
-                    overflow: auto;
-                    white-space: pre-wrap;
-                    user-select: text;
-                    display: none;
-                }}
-                #legend-container {{
-                    position: fixed;
-                    top: 20px;
-                    right: 280px;
-                    width: 200px;
-                    font-size: 12px;
-                    background-color: rgba(255, 255, 255, 0.8);
-                    padding: 10px;
-                    border-radius: 5px;
-                    box-shadow: 0 0 10px rgba(0,0,0,0.1);
-                }}
-                #legend-svg {{
-                    width: 100%;
-                    height: 40px;
-                }}
-                #node-info-settings {{
-                    position: fixed;
-                    top: 20px;
-                    right: 20px;
-                    background-color: white;
-                    padding: 10px;
-                    border: 1px solid black;
-                    z-index: 1000;
-                }}
-                .node-info-header {{
-                    display: flex;
-                    justify-content: space-between;
-                    align-items: center;
-                    margin-bottom: 10px;
-                }}
-                .toggle-button {{
-                    background: none;
-                    border: none;
-                    font-size: 20px;
-                    cursor: pointer;
-                }}
-                .node-info-item {{
-                    margin-bottom: 5px;
-                }}
-                #node-layout-input {{
-                    width: 100%;
-                    margin-top: 10px;
-                }}
-                #font-size-slider {{
-                    width: 100%;
-                    margin-top: 10px;
-                }}
-                #max-font-size-display {{
-                    margin-top: 5px;
-                }}
-            </style>
-        </head>
-        <body>
-            <div id="tree-container"></div>
-            <div id="tooltip" class="tooltip" style="opacity: 0;"></div>
-            <div id="context-menu" class="context-menu" style="display: none;">
-                <button id="add-button">Add</button>
-                <button id="remove-button">Remove</button>
-            </div>
-            <div class="button-container">
-                <button onclick="viewStoredData()">View Stored Data</button>
-                <button onclick="removeStoredData()">Remove Stored Data</button>
-                <button onclick="storeTheData()">Store The Data</button>
-                <button onclick="loadTSVFile()">Load TSV File</button>
-            </div>
-            <div id="legend-container"></div>
-            <div id="custom-alert"></div>
-            <div id="stored-data-display"></div>
-            <div id="node-info-settings">
-                <div class="node-info-header">
-                    <h3 style="margin: 0;">Node Display Settings</h3>
-                    <button id="toggle-widget" class="toggle-button">−</button>
-                </div>
-                <div id="widget-content">
-                    <div id="node-info-checkboxes"></div>
-                    <input type="text" id="node-layout-input" placeholder="Enter node layout">
-                    <button onclick="updateNodeDisplay()">Update Display</button>
-                    <div>
-                        <label for="font-size-slider">Max Font Size:</label>
-                        <input type="range" id="font-size-slider" min="10" max="80" value="20">
-                        <span id="max-font-size-display">20</span>
-                    </div>
-                </div>
-            </div>
-            <script>
-            const treeData = {json.dumps(tree_data)};
-            const layout = "{layout}";
-            const info_type = "{info_type}";
-            const font = "{font}";
-            const level = "{level}";
-
-            const width = window.innerWidth;
-            const height = window.innerHeight;
-            const margin = {{top: 50, right: 50, bottom: 50, left: 50}};
-
-            let tree, root;
-
-            if (layout === "circular") {{
-                const radius = Math.min(width, height) / 2 - Math.max(margin.top, margin.right, margin.bottom, margin.left);
-                tree = d3.cluster().size([2 * Math.PI, radius]);
-                root = tree(d3.hierarchy(treeData).sort((a, b) => d3.ascending(a.data.name, b.data.name)));
-            }} else {{
-                const nodeCount = d3.hierarchy(treeData).descendants().length;
-                const treeHeight = Math.max(height - margin.top - margin.bottom, nodeCount * 15);
-                tree = d3.tree().size([treeHeight, width - margin.left - margin.right]);
-                root = tree(d3.hierarchy(treeData));
-            }}
-
-            const svg = d3.select("#tree-container").append("svg")
-                .attr("width", "100%")
-                .attr("height", "100%")
-                .attr("viewBox", layout === "circular" ? [-width / 2, -height / 2, width, height] : [0, 0, width, height])
-                .style("font", "10px sans-serif")
-                .style("user-select", "none");
-
-            const g = svg.append("g");
-
-            if (layout === "linear") {{
-                g.attr("transform", `translate(${{margin.left}},${{margin.top}})`);
-            }}
-
-            const cumulative_values = root.descendants().map(d => d.data.cumulative_value);
-            const minValue = d3.min(cumulative_values);
-            const maxValue = d3.max(cumulative_values);
-
-            let colorScale, fontSizeScale;
-
-            function updateScales(maxFontSize) {{
-                const minFontSize = 5;  // 최소 폰트 크기
-                const fontSizes = [];
-                const step = (maxFontSize - minFontSize) / 8;
-                
-                for (let i = 1; i < 8; i++) {{  // 가장 작은 값을 무시하고 7개의 값만 사용
-                    fontSizes.push(minFontSize + step * i);
-                }}
-
-                if (level === "continuous") {{
-                    if (font === "absolutely") {{
-                        colorScale = d3.scaleSequential(d3.interpolateRainbow)
-                            .domain([1, 0]);
-
-                        fontSizeScale = d3.scaleQuantile()
-                            .domain([0.00001, 1])
-                            .range(fontSizes);
-                    }} else {{ // relatively
-                        colorScale = d3.scaleSequential(d3.interpolateRainbow)
-                            .domain([maxValue, minValue]);
-
-                        fontSizeScale = d3.scaleQuantile()
-                            .domain([minValue, maxValue])
-                            .range(fontSizes);
-                    }}
-                }} else {{ // discontinuous
-                    const colors = ["#8F00FF", "#4B0082", "#0000FF", "#00FF00", "#FFFF00", "#FF7F00", "#FF0000"];
-                    if (font === "absolutely") {{
-                        const thresholds = [0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1]; //Arabidopsis의 chloroplast/all protein 비율이 0.0125정도임
-                        colorScale = d3.scaleThreshold()
-                            .domain(thresholds)
-                            .range(colors);
-
-                        fontSizeScale = d3.scaleThreshold()
-                            .domain(thresholds)
-                            .range(fontSizes);
-                    }} else {{ // relatively
-                        const step = (maxValue - minValue) / (colors.length - 1);
-                        const thresholds = d3.range(colors.length - 1).map(i => minValue + step * (i + 1));
-                        
-                        colorScale = d3.scaleThreshold()
-                            .domain(thresholds)
-                            .range(colors);
-
-                        fontSizeScale = d3.scaleQuantile()
-                            .domain([minValue, maxValue])
-                            .range(fontSizes);
-                    }}
-                }}
-            }}
-
-            // Initialize scales with default max font size
-            updateScales(20);
-
-            function getColor(cumulative_value) {{
-                return colorScale(cumulative_value);
-            }}
-
-            function getFontSize(cumulative_value) {{
-                return fontSizeScale(Math.max(0.00001, cumulative_value));
-            }}
-
-            const link = g.append("g")
-                .attr("fill", "none")
-                .attr("stroke", "#555")
-                .attr("stroke-opacity", 0.4)
-                .attr("stroke-width", 1.5)
-                .selectAll("path")
-                .data(root.links())
-                .join("path")
-                .attr("d", layout === "circular" 
-                    ? d3.linkRadial().angle(d => d.x).radius(d => d.y)
-                    : d3.linkHorizontal().x(d => d.y).y(d => d.x));
-
-
-            const toggleButton = document.getElementById('toggle-widget');
-            const widgetContent = document.getElementById('widget-content');
-            let isWidgetOpen = true;
-
-            toggleButton.addEventListener('click', () => {{
-                isWidgetOpen = !isWidgetOpen;
-                widgetContent.style.display = isWidgetOpen ? 'block' : 'none';
-                toggleButton.textContent = isWidgetOpen ? '−' : '+';
-            }});
-                
-            let nodeInfoDisplay = {{
-                'sci_name': true,
-                'rank': true,
-                'taxid': false,
-                'count': false,
-                'value': false,
-                'cumulative_count': false,
-                'cumulative_value': false
-            }};
-
-            let nodeLayout = "$(sci_name) ($(rank))";
-
-            function createNodeInfoSettings() {{
-                const container = document.getElementById('node-info-checkboxes');
-                for (const [key, value] of Object.entries(nodeInfoDisplay)) {{
-                    const div = document.createElement('div');
-                    div.className = 'node-info-item';
-                    const checkbox = document.createElement('input');
-                    checkbox.type = 'checkbox';
-                    checkbox.id = key;
-                    checkbox.checked = value;
-                    checkbox.onchange = updateCheckboxState;
-                    const label = document.createElement('label');
-                    label.htmlFor = key;
-                    label.textContent = key;
-                    div.appendChild(checkbox);
-                    div.appendChild(label);
-                    container.appendChild(div);
-                }}
-                document.getElementById('node-layout-input').value = nodeLayout;
-            }}
-
-            function updateCheckboxState(event) {{
-                const key = event.target.id;
-                nodeInfoDisplay[key] = event.target.checked;
-                updateNodeLayout();
-            }}
-
-            function updateNodeLayout() {{
-                let newLayout = "";
-                for (const [key, value] of Object.entries(nodeInfoDisplay)) {{
-                    if (value) {{
-                        newLayout += `$(${{key}}) `;
-                    }}
-                }}
-                nodeLayout = newLayout.trim();
-                document.getElementById('node-layout-input').value = nodeLayout;
-                updateNodeDisplay();
-            }}
-
-            function updateNodeDisplay() {{
-                nodeLayout = document.getElementById('node-layout-input').value;
-                updateNodeText();
-            }}
-
-            function updateNodeText() {{
-                node.selectAll('text')
-                    .text(d => getNodeLabel(d.data))
-                    .attr("fill", d => getColor(d.data.cumulative_value))
-                    .style("font-size", d => `${{getFontSize(d.data.cumulative_value)}}px`);
-            }}
-
-            function getNodeLabel(data) {{
-                let label = nodeLayout;
-                const placeholders = {{
-                    '$(sci_name)': data.sci_name,
-                    '$(rank)': data.rank,
-                    '$(taxid)': data.name.split('(ID:')[1].split(',')[0].trim(),
-                    '$(count)': data.count,
-                    '$(value)': data.value.toFixed(4),
-                    '$(cumulative_count)': data.cumulative_count,
-                    '$(cumulative_value)': data.cumulative_value.toFixed(4)
-                }};
-
-                for (const [placeholder, value] of Object.entries(placeholders)) {{
-                    label = label.replace(placeholder, value);
-                }}
-
-                return label.trim();
-            }}
-
-            createNodeInfoSettings();
-
-            const node = g.append("g")
-                .attr("stroke-linejoin", "round")
-                .attr("stroke-width", 3)
-                .selectAll("g")
-                .data(root.descendants())
-                .join("g")
-                .attr("transform", d => layout === "circular"
-                    ? `rotate(${{d.x * 180 / Math.PI - 90}}) translate(${{d.y}},0)`
-                    : `translate(${{d.y}},${{d.x}})`);
-
-            node.append("circle")
-                .attr("fill", d => d.children ? "#555" : "#999")
-                .attr("r", 2.5);
-
-            node.append("text")
-                .attr("dy", "0.31em")
-                .attr("x", d => layout === "circular"
-                    ? (d.x < Math.PI === !d.children ? 6 : -6)
-                    : (d.children ? -6 : 6))
-                .attr("text-anchor", d => layout === "circular"
-                    ? (d.x < Math.PI === !d.children ? "start" : "end")
-                    : (d.children ? "end" : "start"))
-                .attr("transform", d => layout === "circular" && d.x >= Math.PI ? "rotate(180)" : null)
-                .text(d => getNodeLabel(d.data))
-                .attr("fill", d => getColor(d.data.cumulative_value))
-                .style("font-size", d => `${{getFontSize(d.data.cumulative_value)}}px`)
-                .clone(true).lower()
-                .attr("stroke", "white");
-
-            const tooltip = d3.select("#tooltip");
-            const contextMenu = d3.select("#context-menu");
-
-            let activeNode = null;
-            let hideTimer = null;
-            let isMouseOverNode = false;
-            let isMouseOverTooltipOrMenu = false;
-
-            function showTooltipAndMenu(event, d) {{
-                if (activeNode !== d) {{
-                    clearTimeout(hideTimer);
-                    hideTooltipAndMenu(() => {{
-                        displayNodeInfo(event, d);
-                    }});
-                }}
-                isMouseOverNode = true;
-            }}
-
-            function displayNodeInfo(event, d) {{
-                const [x, y] = d3.pointer(event, svg.node());
-                const adjustedX = x + (layout === "circular" ? width / 2 : 0);
-                const adjustedY = y + (layout === "circular" ? height / 2 : 0);
-                
-                tooltip.style("opacity", 0)
-                    .style("left", adjustedX + "px")
-                    .style("top", adjustedY + "px")
-                    .html(`<div>
-                            <strong>${{d.data.sci_name}}</strong><br/>
-                            Rank: ${{d.data.rank}}<br/>
-                            Taxid: ${{d.data.name.split('(ID:')[1].split(',')[0].trim()}}<br/>
-                            Count: ${{d.data.count}}<br/>
-                            Value: ${{d.data.value.toFixed(4)}}<br/>
-                            Cumulative Count: ${{d.data.cumulative_count}}<br/>
-                            Cumulative Value: ${{d.data.cumulative_value.toFixed(4)}}
-                            ${{info_type === 'ratio' ? `<br/>Whole Count: ${{d.data.whole_count}}<br/>Cumulative Whole Count: ${{d.data.cumulative_whole_count}}` : ''}}
-                           </div>`);
-
-                tooltip.transition().duration(200).style("opacity", 0.9);
-
-                const tooltipRect = tooltip.node().getBoundingClientRect();
-
-                contextMenu.style("opacity", 0)
-                    .style("display", "block")
-                    .style("left", (tooltipRect.right + 5) + "px")
-                    .style("top", tooltipRect.top + "px");
-
-                contextMenu.transition().duration(200).style("opacity", 1);
-
-                d3.select("#add-button").on("click", () => addToTSV(d));
-                d3.select("#remove-button").on("click", () => removeFromTSV(d));
-                
-                activeNode = d;
-            }}
-
-            function startHideTimer() {{
-                isMouseOverNode = false;
-                if (!isMouseOverTooltipOrMenu) {{
-                    clearTimeout(hideTimer);
-                    hideTimer = setTimeout(() => hideTooltipAndMenu(), 500);
-                }}
-            }}
-
-            function hideTooltipAndMenu(callback) {{
-                if (!activeNode || (!isMouseOverNode && !isMouseOverTooltipOrMenu)) {{
-                    tooltip.transition().duration(200).style("opacity", 0);
-                    contextMenu.transition().duration(200).style("opacity", 0);
-                    setTimeout(() => {{
-                        contextMenu.style("display", "none");
-                        activeNode = null;
-                        if (callback) callback();
-                    }}, 200);
-                }}
-            }}
-
-            node.on("mouseover", (event, d) => showTooltipAndMenu(event, d))
-                .on("mouseout", startHideTimer);
-
-            tooltip.on("mouseover", () => {{
-                clearTimeout(hideTimer);
-                isMouseOverTooltipOrMenu = true;
-            }})
-            .on("mouseout", () => {{
-                isMouseOverTooltipOrMenu = false;
-                if (!isMouseOverNode) {{
-                    startHideTimer();
-                }}
-            }});
-
-            contextMenu.on("mouseover", () => {{
-                clearTimeout(hideTimer);
-                isMouseOverTooltipOrMenu = true;
-            }})
-            .on("mouseout", () => {{
-                isMouseOverTooltipOrMenu = false;
-                if (!isMouseOverNode) {{
-                    startHideTimer();
-                }}
-            }});
-
-            function showCustomAlert(message, x, y, isWarning = false) {{
-                const alert = document.getElementById('custom-alert');
-                alert.style.left = (x + 10) + 'px';
-                alert.style.top = (y - 50) + 'px';
-                alert.innerHTML = message;
-                alert.className = isWarning ? 'yellow' : 'blue';
-                alert.style.display = 'block';
-                setTimeout(() => {{
-                    alert.style.display = 'none';
-                }}, 2000);
-            }}
-
-            function addToTSV(d) {{
-                const taxid = d.data.name.split('(ID:')[1].split(',')[0].trim();
-                let stored = JSON.parse(localStorage.getItem('storedData') || '[]');
-                const existingIndex = stored.findIndex(item => item.taxid === taxid);
-                if (existingIndex === -1) {{
-                    stored.push({{
-                        rank: d.data.rank,
-                        sci_name: d.data.sci_name,
-                        taxid: taxid,
-                        count: d.data.count,
-                        ratio: d.data.ratio,
-                        cumulative_count: d.data.cumulative_count,
-                        cumulative_value: d.data.cumulative_value
-                    }});
-                    localStorage.setItem('storedData', JSON.stringify(stored));
-                    showCustomAlert(`Added sci_name ${{d.data.sci_name}} (Taxid: ${{taxid}})`, event.pageX, event.pageY);
-                }} else {{
-                    showCustomAlert(`Taxid ${{taxid}} already exists in stored data`, event.pageX, event.pageY, true);
-                }}
-            }}
-
-            function removeFromTSV(d) {{
-                const taxid = d.data.name.split('(ID:')[1].split(',')[0].trim();
-                let stored = JSON.parse(localStorage.getItem('storedData') || '[]');
-                stored = stored.filter(item => item.taxid !== taxid);
-                localStorage.setItem('storedData', JSON.stringify(stored));
-                showCustomAlert(`Removed sci_name ${{d.data.sci_name}} (Taxid: ${{taxid}})`, event.pageX, event.pageY);
-            }}
-
-            function viewStoredData() {{
-                let stored = JSON.parse(localStorage.getItem('storedData') || '[]');
-                const storedDataDisplay = document.getElementById('stored-data-display');
-                storedDataDisplay.textContent = JSON.stringify(stored, null, 2);
-                storedDataDisplay.style.display = 'block';
-                const closeButton = document.createElement('button');
-                closeButton.textContent = 'Close';
-                closeButton.style.marginTop = '10px';
-                closeButton.onclick = () => storedDataDisplay.style.display = 'none';
-                
-                storedDataDisplay.appendChild(closeButton);
-            }}
-
-            function storeTheData() {{
-                let stored = JSON.parse(localStorage.getItem('storedData') || '[]');
-                if (stored.length === 0) {{
-                    alert('No data to store. Please add some data first.');
-                    return;
-                }}
-
-                const tsvContent = stored.map(item => 
-                    `${{item.rank}}\t${{item.sci_name}}\t${{item.taxid}}\t${{item.count}}\t${{item.ratio}}\t${{item.cumulative_count}}\t${{item.cumulative_value}}`
-                ).join('\\n');
-
-                const blob = new Blob([tsvContent], {{ type: 'text/tab-separated-values' }});
-                const url = URL.createObjectURL(blob);
-                const link = document.createElement('a');
-                link.href = url;
-                const outputFileName = '{os.path.splitext(os.path.basename(output_file))[0]}';
-                link.download = `${{outputFileName}}.select`;
-                link.click();
-                URL.revokeObjectURL(url);
-                alert('Data has been stored in the TSV file.');
-            }}
-
-            function loadTSVFile() {{
-                if (confirm('Are you sure you want to load the TSV file? This will overwrite the current stored data.')) {{
-                    const input = document.createElement('input');
-                    input.type = 'file';
-                    input.accept = '.select';
-                    input.onchange = function(event) {{
-                        const file = event.target.files[0];
-                        const reader = new FileReader();
-                        reader.onload = function(e) {{
-                            const content = e.target.result;
-                            const lines = content.split('\\n');
-                            const data = lines.map(line => {{
-                                const [rank, sci_name, taxid, count, ratio, cumulative_count, cumulative_value] = line.split('\\t');
-                                return {{ 
-                                    rank, 
-                                    sci_name, 
-                                    taxid, 
-                                    count: parseFloat(count), 
-                                    ratio: parseFloat(ratio),
-                                    cumulative_count: parseFloat(cumulative_count),
-                                    cumulative_value: parseFloat(cumulative_value)
-                                }};
-                            }});
-                            localStorage.setItem('storedData', JSON.stringify(data));
-                            alert('TSV file loaded successfully.');
-                        }};
-                        reader.readAsText(file);
-                    }};
-                    input.click();
-                }}
-            }}
-
-            function removeStoredData() {{
-                if (confirm('Are you sure you want to remove all stored data?')) {{
-                    localStorage.removeItem('storedData');
-                    alert('All stored data has been removed.');
-                }}
-            }}
-
-            const zoom = d3.zoom()
-                .scaleExtent([0.1, 10])
-                .on("zoom", (event) => {{
-                    g.attr("transform", event.transform);
-                    hideTooltipAndMenu();
-                    
-                    node.selectAll("text")
-                        .style("font-size", d => `${{getFontSize(d.data.cumulative_value) / Math.sqrt(event.transform.k)}}px`);
-                }});
-
-            svg.call(zoom);
-
-            // Font size slider
-            const fontSizeSlider = document.getElementById('font-size-slider');
-            const maxFontSizeDisplay = document.getElementById('max-font-size-display');
-
-            fontSizeSlider.addEventListener('input', function() {{
-                const maxFontSize = parseInt(this.value);
-                maxFontSizeDisplay.textContent = maxFontSize;
-                updateScales(maxFontSize);
-                updateNodeText();
-            }});
-
-            </script>
-        </body>
-        </html>
-        """
-        
-        print(f"HTML content created. Length: {len(html_content)} characters")
-
-        with open(output_file, 'w', encoding='utf-8') as f:
-            f.write(html_content)
-        
-        print(f"HTML file written to {output_file}")
+        base, ext = os.path.splitext(output_file)
+        if ext.casefold() == '.gz':
+            base = os.path.splitext(base)[0]
+            f = io.TextIOWrapper(gzip.GzipFile(output_file, 'wb', compresslevel=1, mtime=0), encoding='utf-8')
+        else:
+            f = open(output_file, 'w', encoding='utf-8', buffering=1 << 17)
+
+        with f:
+            f.write(HTML_HEAD)
+            payload = gzip.compress(dump_json(tree_data), compresslevel=6, mtime=0)
+            f.write(base64.b64encode(payload).decode('ascii'))
+            f.write(HTML_TAIL.substitute(
+                layout=layout,
+                info_type=info_type,
+                font=font,
+                level=level,
+                output_name=os.path.basename(base),
+            ))
+
+        logger.info("HTML file written to %s", output_file)
         
         if os.path.exists(output_file):
-            print(f"Confirmed: {output_file} exists.")
-            print(f"File size: {os.path.getsize(output_file)} bytes")
+            logger.info("Confirmed: %s exists.", output_file)
+            logger.info("File size: %d bytes", os.path.getsize(output_file))
         else:
-            print(f"Error: {output_file} was not created.")
+            logger.error("Error: %s was not created.", output_file)
         
     except Exception as e:
-        print(f"Error in create_html_output: {str(e)}")
-        print("Traceback:")
-        traceback.print_exc()
-
-def tree_to_dict(node):
-    node_dict = {
-        "name": node.name,
-        "children": [tree_to_dict(child) for child in node.children],
-        "rank": getattr(node, "rank", ""),
-        "sci_name": getattr(node, "sci_name", ""),
-        "count": getattr(node, "count", 0),
-        "value": getattr(node, "value", 0), 
-        "cumulative_count": getattr(node, "cumulative_count", getattr(node, "count", 0)),
-        "cumulative_value": getattr(node, "cumulative_value", getattr(node, "value", 0))
-    }
-    if hasattr(node, "whole_count"):
-        node_dict["whole_count"] = node.whole_count
-    if hasattr(node, "cumulative_whole_count"):
-        node_dict["cumulative_whole_count"] = node.cumulative_whole_count
-    return node_dict
+        logger.exception("Error in create_html_output: %s", e)
+
+def dump_json(data):
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+def tree_to_columns(tree):
+    # One parallel array per field, in preorder with siblings kept in order; the page rebuilds the hierarchy.
+    columns = {key: [] for key in ("parent", "name", "taxid", "rank", "sci_name", "count", "value",
+                                   "cumulative_count", "cumulative_value")}
+    ratio = tree.whole_count is not None
+    if ratio:
+        columns["whole_count"] = []
+        columns["cumulative_whole_count"] = []
+
+    order, parents = flatten_tree(tree)
+    columns["parent"] = parents
+    for node in order:
+        columns["name"].append(node.name)
+        columns["taxid"].append(node.taxid)
+        columns["rank"].append(node.rank)
+        columns["sci_name"].append(node.sci_name)
+        columns["count"].append(node.count)
+        columns["value"].append(node.value)
+        columns["cumulative_count"].append(node.count if node.cumulative_count is None else node.cumulative_count)
+        columns["cumulative_value"].append(node.value if node.cumulative_value is None else node.cumulative_value)
+        if ratio:
+            columns["whole_count"].append(node.whole_count)
+            columns["cumulative_whole_count"].append(node.cumulative_whole_count)
+    return columns
+
 def main():
     parser = argparse.ArgumentParser(description="Generate a phylogenetic tree from NCBI taxids (TSV input).")
     parser.add_argument("input_file", help="Input TSV file containing taxids and counts/ratios")
-    parser.add_argument("output_file", help="Output file name (e.g., tree.html)")
+    parser.add_argument("output_file", help="Output file name (e.g., tree.html or tree.html.gz)")
     parser.add_argument("--taxdump", help="Path to taxdump.tar.gz file", required=True)
     parser.add_argument("--layout", choices=["circular", "linear"], default="circular", help="Tree layout (default: circular)")
     parser.add_argument("--info", choices=["count", "ratio"], default="count", help="Type of information in the input file (default: count)")
     parser.add_argument("--font", choices=["absolutely", "relatively"], default="absolutely", help="Font scaling method (default: absolutely)")
     parser.add_argument("--level", choices=["continuous", "discontinuous"], default="discontinuous", help="Color and font scaling method (default: discontinuous)")
+    parser.add_argument("--force-rebuild", action="store_true", help="Rebuild the cached taxonomy database even if one exists for this taxdump")
     args = parser.parse_args()
 
-    print("Processing taxdump file...")
-    db_path = process_taxdump(args.taxdump)
-    print("Taxdump processed and database ready.")
-
-    ncbi = CustomNCBITaxa(db_path)
-
-    data = read_data(args.input_file, args.info)
-    if not data:
-        print("Error: No valid data found in the input file.")
+    # Progress messages are held in memory and written out at each phase boundary; warnings and
+    # errors flush straight away.
+    console = logging.StreamHandler()
+    console.setFormatter(logging.Formatter("%(message)s"))
+    log_buffer = logging.handlers.MemoryHandler(1000, flushLevel=logging.WARNING, target=console)
+    logging.basicConfig(level=logging.INFO, handlers=[log_buffer])
+
+    base, ext = os.path.splitext(args.output_file)
+    if ext.casefold() == '.gz':
+        ext = os.path.splitext(base)[1]
+    if ext.casefold() != '.html':
+        logger.error("Error: Output file must be an HTML file (.html or .html.gz).")
         sys.exit(1)
 
-    if not args.output_file.lower().endswith('.html'):
-        print("Error: Output file must be an HTML file.")
+    rows = read_data(args.input_file, args.info)
+    first_row = next(rows, None)
+    if first_row is None:
+        logger.error("Error: No valid data found in the input file.")
         sys.exit(1)
+    rows = itertools.chain([first_row], rows)
+
+    # Building the database and reading the input touch different files, so overlap them.
+    logger.info("Processing taxdump file...")
+    log_buffer.flush()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+        db_future = executor.submit(process_taxdump, args.taxdump, args.force_rebuild)
+        data_future = executor.submit(dict, rows)
+        db_path = db_future.result()
+        data = data_future.result()
+    logger.info("Taxdump processed and database ready.")
+
+    ncbi = CustomNCBITaxa(db_path)
 
     try:
-        print(f"Creating {args.layout} tree...")
-        tree, ts = create_tree(data, ncbi, args.layout, args.info)
-        print(f"{args.layout.capitalize()} tree created successfully.")
+        logger.info("Creating %s tree...", args.layout)
+        log_buffer.flush()
+        tree = create_tree(data, ncbi, args.info)
+        logger.info("%s tree created successfully.", args.layout.capitalize())
 
-        print("Generating HTML output...")
+        logger.info("Generating HTML output...")
+        log_buffer.flush()
         create_html_output(tree, args.output_file, args.layout, args.info, args.font, args.level)
 
-        print(f"{args.layout.capitalize()} tree has been saved as '{args.output_file}'")
-        print(f"You can open this file in a web browser to view the tree.")
+        logger.info("%s tree has been saved as '%s'", args.layout.capitalize(), args.output_file)
+        logger.info("You can open this file in a web browser to view the tree.")
+        log_buffer.flush()
 
     except Exception as e:
-        print(f"Error in main: {str(e)}")
-        print("Traceback:")
-        traceback.print_exc()
+        logger.exception("Error in main: %s", e)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file